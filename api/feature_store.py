@@ -0,0 +1,123 @@
+import os
+import json
+import time
+from collections import OrderedDict
+import boto3
+from botocore.config import Config
+
+BATCH_GET_LIMIT = 100
+BATCH_GET_RETRIES = 3
+# Fail fast on the hot path, an unreachable table returns 502 instead of hanging the lambda
+CONNECT_TIMEOUT = 1
+READ_TIMEOUT = 1
+
+store_columns = [
+    'orig_txn_count',
+    'orig_amount_sum',
+    'orig_last_transfer_step',
+    'dest_txn_count',
+    'dest_amount_sum'
+]
+
+class FeatureStoreError(Exception):
+    pass
+
+class LRUCache:
+    # In-container cache, survives between invocations of a warm lambda.
+    # Entries expire so a republished table is picked up without a cold start.
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+
+    def get(self, key):
+        if key not in self.items:
+            return False, None
+        expires_at, value = self.items[key]
+        if time.monotonic() >= expires_at:
+            del self.items[key]
+            return False, None
+        self.items.move_to_end(key)
+        return True, value
+
+    def put(self, key, value, ttl=None):
+        self.items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+class DynamoFeatureStore:
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.dynamodb = boto3.resource('dynamodb', config=Config(
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            retries={'max_attempts': BATCH_GET_RETRIES, 'mode': 'standard'}
+        ))
+
+    def batch_get(self, account_ids):
+        items = {}
+        for i in range(0, len(account_ids), BATCH_GET_LIMIT):
+            request = {self.table_name: {'Keys': [{'account_id': account_id} for account_id in account_ids[i:i+BATCH_GET_LIMIT]]}}
+            for attempt in range(BATCH_GET_RETRIES):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(self.table_name, []):
+                    items[item.pop('account_id')] = {key: float(value) for key, value in item.items()}
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                time.sleep(0.05 * 2**attempt)
+            if request:
+                raise FeatureStoreError('Could not fetch all account features after retries')
+        return items
+
+class LocalFeatureStore:
+    # Local stand-in for the DynamoDB table, stored as a JSON file (empty without one)
+    def __init__(self, path=None):
+        self.items = {}
+        if path:
+            with open(path) as f:
+                self.items = json.load(f)
+
+    def batch_get(self, account_ids):
+        return {account_id: self.items[account_id] for account_id in account_ids if account_id in self.items}
+
+store = None
+cache = LRUCache(int(os.environ.get('feature_cache_size', 10000)), float(os.environ.get('feature_cache_ttl', 3600)))
+negative_ttl = float(os.environ.get('feature_cache_negative_ttl', 60))
+
+def get_feature_store():
+    global store
+    if store is None:
+        if 'feature_store_path' in os.environ:
+            store = LocalFeatureStore(os.environ['feature_store_path'])
+        else:
+            store = DynamoFeatureStore(os.environ['feature_table_name'])
+    return store
+
+def get_account_features(account_ids):
+    features = {}
+    missing = []
+    for account_id in dict.fromkeys(account_ids):
+        hit, value = cache.get(account_id)
+        if hit:
+            features[account_id] = value
+        else:
+            missing.append(account_id)
+    if missing:
+        try:
+            fetched = get_feature_store().batch_get(missing)
+        except FeatureStoreError:
+            raise
+        except Exception as e:
+            raise FeatureStoreError(str(e)) from e
+        for account_id in missing:
+            # Unknown accounts are cached too, as an empty history, for a short time
+            if account_id in fetched:
+                value = fetched[account_id]
+                cache.put(account_id, value)
+            else:
+                value = {}
+                cache.put(account_id, value, ttl=negative_ttl)
+            features[account_id] = value
+    return features
@@ -1,7 +1,9 @@
 import boto3
 import os
 import pandas as pd
+import io
 import json
+import feature_store
 
 sagemaker = boto3.client('sagemaker-runtime')
 sagemaker_client = boto3.client('sagemaker')
@@ -11,6 +13,18 @@ fraudulend_types = [
     'TRANSFER'
 ]
 
+# Models registered before the account features have no "feature_set" and get the base payload
+FEATURE_SET_BASE = 'base'
+FEATURE_SET_ACCOUNT = 'account'
+
+account_feature_columns = [
+    'orig_txn_count',
+    'orig_amount_sum',
+    'orig_steps_since_transfer',
+    'dest_txn_count',
+    'dest_amount_sum'
+]
+
 def check_body(event):
     print("EVENT:", event)
     if 'body' not in event:
@@ -34,8 +48,33 @@ def fill_dummies(df):
     for column in fraudulend_types+['other']:
         df[column.lower()] = df['type'].apply(check, compare=column)
 
-def treat_transaction(transactions):
-    df = pd.read_json(json.dumps(transactions), orient='index')
+def account_state(df):
+    features = feature_store.get_account_features(list(df['nameOrig']) + list(df['nameDest']))
+    df_store = pd.DataFrame.from_dict(features, orient='index')
+    df_store = df_store.reindex(columns=feature_store.store_columns, index=list(features.keys()))
+    orig_state = df_store[['orig_txn_count', 'orig_amount_sum', 'orig_last_transfer_step']]
+    orig_state.columns = ['txn_count', 'amount_sum', 'last_transfer_step']
+    dest_state = df_store[['dest_txn_count', 'dest_amount_sum']]
+    dest_state.columns = ['txn_count', 'amount_sum']
+    return orig_state, dest_state
+
+def account_features(df, orig_state, dest_state):
+    # Same point-in-time features as the data-prep stage, on top of the stored history
+    orig = df['nameOrig']
+    dest = df['nameDest']
+    features = pd.DataFrame(index=df.index)
+    features['orig_txn_count'] = df.groupby('nameOrig').cumcount() + orig.map(orig_state['txn_count']).fillna(0)
+    features['orig_amount_sum'] = round(df.groupby('nameOrig')['amount'].cumsum() - df['amount'] + orig.map(orig_state['amount_sum']).fillna(0), 2)
+    transfer_step = df['step'].where(df['type'] == 'TRANSFER')
+    last_transfer_step = transfer_step.groupby(orig).shift().groupby(orig).ffill()
+    last_transfer_step = last_transfer_step.fillna(orig.map(orig_state['last_transfer_step']))
+    features['orig_steps_since_transfer'] = (df['step'] - last_transfer_step).fillna(-1)
+    features['dest_txn_count'] = df.groupby('nameDest').cumcount() + dest.map(dest_state['txn_count']).fillna(0)
+    features['dest_amount_sum'] = round(df.groupby('nameDest')['amount'].cumsum() - df['amount'] + dest.map(dest_state['amount_sum']).fillna(0), 2)
+    return features
+
+def treat_transaction(transactions, feature_set=FEATURE_SET_BASE):
+    df = pd.read_json(io.StringIO(json.dumps(transactions)), orient='index', dtype={'nameOrig': str, 'nameDest': str})
     df_modeled = df[['step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig', 'oldbalanceDest', 'newbalanceDest']]
     df_modeled.columns = ['step', 'type', 'amount', 'orig_balance_old', 'orig_balance_new', 'dest_balance_old', 'dest_balance_new']
     df_modeled['type'] = df_modeled['type'].apply(change_type)
@@ -45,6 +84,11 @@ def treat_transaction(transactions):
     df_modeled['orig_balance_change'] = round(df_modeled['orig_balance_new'] - df_modeled['orig_balance_old'], 2)
     df_modeled['dest_balance_change'] = round(df_modeled['dest_balance_new'] - df_modeled['dest_balance_old'], 2)
     df_modeled.drop(['orig_balance_new', 'dest_balance_new'], axis='columns', inplace=True)
+    if feature_set == FEATURE_SET_ACCOUNT:
+        orig_state, dest_state = account_state(df)
+        df_sorted = df.sort_values('step', kind='stable')
+        df_features = account_features(df_sorted, orig_state, dest_state).loc[df.index]
+        df_modeled = pd.concat([df_modeled, df_features[account_feature_columns]], axis='columns')
     payload = df_modeled.to_csv(header=False, index=False)
     if df_modeled.shape[0] == 1:
         payload = payload[:-1].replace('\n', ',')
@@ -69,12 +113,6 @@ def lambda_handler(event, context):
     if not valid:
         return body
     
-    try:
-        payload = treat_transaction(body['transactions'])
-        print("PAYLOAD:", payload)
-    except:
-        return {"statusCode": 400, "body": "Could not transform input. Check API documentation for details!"}
-    
     if 'model_package_arn' in body:
         try:
             model_details = sagemaker_client.describe_model_package(
@@ -83,8 +121,19 @@ def lambda_handler(event, context):
             endpoint_name = model_details['CustomerMetadataProperties']['endpoint_name']
         except:
             return {'statusCode': 502, 'body': 'Could not find endpoint name. Try deploying endpoint first.'}
+        feature_set = model_details['CustomerMetadataProperties'].get('feature_set', FEATURE_SET_BASE)
     else:
         endpoint_name = body['endpoint_name']
+        feature_set = os.environ.get('default_feature_set', FEATURE_SET_BASE)
+
+    try:
+        payload = treat_transaction(body['transactions'], feature_set)
+        print("PAYLOAD:", payload)
+    except feature_store.FeatureStoreError as e:
+        print("FEATURE STORE ERROR:", e)
+        return {"statusCode": 502, "body": "Could not fetch account features. Check CloudWatch logs for details"}
+    except:
+        return {"statusCode": 400, "body": "Could not transform input. Check API documentation for details!"}
 
     try:
         response = sagemaker.invoke_endpoint(
@@ -1,13 +1,26 @@
+import numpy as np
 import pandas as pd
 import boto3
+import feature_store
 
 s3 = boto3.client('s3')
 
+CHUNK_SIZE = 500000
+FEATURE_SHARD_SIZE = 100000
+
 fraudulend_types = [
     'CASH_OUT',
     'TRANSFER'
 ]
 
+account_feature_columns = [
+    'orig_txn_count',
+    'orig_amount_sum',
+    'orig_steps_since_transfer',
+    'dest_txn_count',
+    'dest_amount_sum'
+]
+
 def split_uri(uri):
     # Remove o "s3://"
     uri = uri[5:]
@@ -42,9 +55,70 @@ def fill_dummies(df):
     for column in fraudulend_types+['other']:
         df[column.lower()] = df['type'].apply(check, compare=column)
 
-def model_data(event):
-    # Load dataset
-    df_raw = pd.read_csv(load_bytes_from_s3(event["input_uri"]))
+class AccountState:
+    # Per-account aggregates kept in append-only segments. Each chunk only probes
+    # the (cached) index of every segment, the whole state is never re-aggregated.
+    def __init__(self, aggregations):
+        self.aggregations = aggregations
+        self.segments = []
+
+    def lookup(self, accounts):
+        found = {column: np.full(len(accounts), np.nan) for column in self.aggregations}
+        positions = []
+        for index, values in self.segments:
+            position = index.get_indexer(accounts)
+            hit = position >= 0
+            for column in self.aggregations:
+                found[column][hit] = values[column][position[hit]]
+            positions.append(position)
+        return pd.DataFrame(found, index=accounts), positions
+
+    def update(self, chunk_state, positions):
+        # "chunk_state" must be indexed by the same accounts given to lookup
+        new = np.ones(chunk_state.shape[0], dtype=bool)
+        for (index, values), position in zip(self.segments, positions):
+            hit = position >= 0
+            new &= ~hit
+            for column, how in self.aggregations.items():
+                current = values[column][position[hit]]
+                incoming = chunk_state[column].to_numpy(dtype=float)[hit]
+                values[column][position[hit]] = current + incoming if how == 'sum' else np.fmax(current, incoming)
+        if new.any():
+            self.segments.append((chunk_state.index[new], {column: chunk_state[column].to_numpy(dtype=float)[new] for column in self.aggregations}))
+
+    def to_frame(self):
+        return pd.concat([pd.DataFrame(values, index=index) for index, values in self.segments])
+
+def account_features(df, orig_state, dest_state):
+    # Point-in-time features: each transaction only sees the history before it
+    orig = df['nameOrig']
+    dest = df['nameDest']
+    features = pd.DataFrame(index=df.index)
+    features['orig_txn_count'] = df.groupby('nameOrig').cumcount() + orig.map(orig_state['txn_count']).fillna(0)
+    features['orig_amount_sum'] = round(df.groupby('nameOrig')['amount'].cumsum() - df['amount'] + orig.map(orig_state['amount_sum']).fillna(0), 2)
+    transfer_step = df['step'].where(df['type'] == 'TRANSFER')
+    last_transfer_step = transfer_step.groupby(orig).shift().groupby(orig).ffill()
+    last_transfer_step = last_transfer_step.fillna(orig.map(orig_state['last_transfer_step']))
+    features['orig_steps_since_transfer'] = (df['step'] - last_transfer_step).fillna(-1)
+    features['dest_txn_count'] = df.groupby('nameDest').cumcount() + dest.map(dest_state['txn_count']).fillna(0)
+    features['dest_amount_sum'] = round(df.groupby('nameDest')['amount'].cumsum() - df['amount'] + dest.map(dest_state['amount_sum']).fillna(0), 2)
+    return features
+
+def chunk_account_state(df):
+    orig_grouped = df.groupby('nameOrig')
+    orig_chunk = pd.DataFrame({
+        'txn_count': orig_grouped.size(),
+        'amount_sum': orig_grouped['amount'].sum(),
+        'last_transfer_step': df['step'].where(df['type'] == 'TRANSFER').groupby(df['nameOrig']).max()
+    })
+    dest_grouped = df.groupby('nameDest')
+    dest_chunk = pd.DataFrame({
+        'txn_count': dest_grouped.size(),
+        'amount_sum': dest_grouped['amount'].sum()
+    })
+    return orig_chunk, dest_chunk
+
+def model_chunk(df_raw, orig_state, dest_state):
     # Select columns and rename
     df_modeled = df_raw[['isFraud', 'step', 'type', 'amount', 'oldbalanceOrg', 'newbalanceOrig', 'oldbalanceDest', 'newbalanceDest']]
     df_modeled.columns = ['is_fraud', 'step', 'type', 'amount', 'orig_balance_old', 'orig_balance_new', 'dest_balance_old', 'dest_balance_new']
@@ -56,17 +130,50 @@ def model_data(event):
     df_modeled['orig_balance_change'] = round(df_modeled['orig_balance_new'] - df_modeled['orig_balance_old'], 2)
     df_modeled['dest_balance_change'] = round(df_modeled['dest_balance_new'] - df_modeled['dest_balance_old'], 2)
     df_modeled.drop(['orig_balance_new', 'dest_balance_new'], axis='columns', inplace=True)
-    return df_modeled
+    # Rolling per-account history
+    df_features = account_features(df_raw, orig_state, dest_state)
+    return pd.concat([df_modeled, df_features[account_feature_columns]], axis='columns')
+
+def under_sample_positions(event):
+    # First pass over the label only, so the undersample is sized from the global fraud count
+    labels = pd.read_csv(load_bytes_from_s3(event["input_uri"]), usecols=['isFraud'])['isFraud']
+    min_value = int((labels == 1).sum())
+    non_fraud_count = int((labels == 0).sum())
+    if min_value*event['undersample_ratio'] > non_fraud_count:
+        print('Under sample ratio too high to cut data off!')
+        return None
+    # Ordinals of the non fraud rows to keep, in the order they are streamed
+    return np.sort(np.random.default_rng().choice(non_fraud_count, min_value*event['undersample_ratio'], replace=False))
 
-def under_sample(df, ratio):
+def under_sample(df, positions, offset):
     df_true = df.query('is_fraud == 1')
     df_false = df.query('is_fraud == 0')
-    min_value = df_true.shape[0]
-    try:
-        df_false = df_false.sample(min_value*ratio)
-    except:
-        print('Under sample ratio too high to cut data off!')
-    return pd.concat([df_true, df_false])
+    next_offset = offset + df_false.shape[0]
+    if positions is not None:
+        start, end = np.searchsorted(positions, [offset, next_offset])
+        df_false = df_false.iloc[positions[start:end] - offset]
+    return pd.concat([df_true, df_false]), next_offset
+
+def model_data(event):
+    # Stream dataset by chunks, carrying the per-account state between them.
+    # Chunks are expected in "step" order, as in the raw dataset.
+    positions = under_sample_positions(event)
+    orig_state = AccountState({'txn_count': 'sum', 'amount_sum': 'sum', 'last_transfer_step': 'max'})
+    dest_state = AccountState({'txn_count': 'sum', 'amount_sum': 'sum'})
+    chunks = []
+    offset = 0
+    for df_raw in pd.read_csv(load_bytes_from_s3(event["input_uri"]), chunksize=event.get('chunk_size', CHUNK_SIZE)):
+        df_raw = df_raw.sort_values('step', kind='stable')
+        orig_chunk, dest_chunk = chunk_account_state(df_raw)
+        orig_prior, orig_positions = orig_state.lookup(orig_chunk.index)
+        dest_prior, dest_positions = dest_state.lookup(dest_chunk.index)
+        df_modeled = model_chunk(df_raw, orig_prior, dest_prior)
+        # Keeps only the sampled rows in memory, same result as undersampling the whole dataset
+        df_under, offset = under_sample(df_modeled, positions, offset)
+        chunks.append(df_under)
+        orig_state.update(orig_chunk, orig_positions)
+        dest_state.update(dest_chunk, dest_positions)
+    return pd.concat(chunks), orig_state.to_frame(), dest_state.to_frame()
 
 def split_df(df, ratio):
     df_true = df.query('is_fraud == 1')
@@ -75,9 +182,7 @@ def split_df(df, ratio):
     df_2 = df[~df.index.isin(df_1.index)]
     return df_1, df_2
 
-def split_data(df_modeled, event):
-    # Undersample
-    df_under = under_sample(df_modeled, event['undersample_ratio'])
+def split_data(df_under, event):
     # Split train, validation and test
     df_test, df_train = split_df(df_under, 0.1)
     df_validation, df_train = split_df(df_train, 0.2)
@@ -87,6 +192,18 @@ def split_data(df_modeled, event):
     save_bytes_to_s3(event["test_uri"].replace('.csv', '_full.csv'), bytes(df_test.to_csv(index=False), encoding='utf-8'))
     save_bytes_to_s3(event["test_uri"], bytes(df_test.drop('is_fraud', axis='columns').to_csv(index=False, header=False), encoding='utf-8'))
 
+def save_account_state(orig_state, dest_state, features_uri):
+    # Published to the feature store by a separate step, one shard at a time
+    df_store = pd.concat([orig_state.add_prefix('orig_'), dest_state.add_prefix('dest_')], axis='columns')
+    df_store = df_store.reindex(columns=feature_store.store_columns)
+    shards = []
+    for i, start in enumerate(range(0, df_store.shape[0], FEATURE_SHARD_SIZE)):
+        shard_uri = f"{features_uri}part-{i:05d}.csv"
+        save_bytes_to_s3(shard_uri, bytes(df_store.iloc[start:start+FEATURE_SHARD_SIZE].to_csv(index_label='account_id'), encoding='utf-8'))
+        shards.append(shard_uri)
+    return shards
+
 def lambda_handler(event, context):
-    df_modeled = model_data(event)
-    split_data(df_modeled, event)
+    df_under, orig_state, dest_state = model_data(event)
+    split_data(df_under, event)
+    return {"feature_shards": save_account_state(orig_state, dest_state, event["features_uri"])}
@@ -0,0 +1,26 @@
+import pandas as pd
+import boto3
+import feature_store
+
+s3 = boto3.client('s3')
+
+def split_uri(uri):
+    # Remove o "s3://"
+    uri = uri[5:]
+    # Quebra o bucket e key
+    bucket = uri.split('/')[0]
+    key = uri[len(bucket)+1:]
+    return (bucket, key)
+
+def load_bytes_from_s3(uri):
+    bucket, key = split_uri(uri)
+    response = s3.get_object(
+        Bucket = bucket,
+        Key = key
+    )
+    return response['Body'] if 'Body' in response else None
+
+def lambda_handler(event, context):
+    df_store = pd.read_csv(load_bytes_from_s3(event["shard_uri"]), index_col='account_id', dtype={'account_id': str})
+    feature_store.get_feature_store().put_items(feature_store.build_items(df_store))
+    return {"shard_uri": event["shard_uri"], "accounts": df_store.shape[0]}
@@ -76,7 +76,9 @@ def create_model_package(model_package_group_name, image_uri, model_uri, precisi
             "precision": str(precision),
             "recall": str(recall),
             "f1": str(f1),
-            "model_name": model_name
+            "model_name": model_name,
+            # Trained with the per-account features, /infer sends them to this model
+            "feature_set": "account"
         }
     }
     create_model_package_input_dict.update(modelpackage_inference_specification)
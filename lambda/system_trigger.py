@@ -13,6 +13,7 @@ def lambda_handler(event, context):
         "train_uri": f"s3://{bucket}/data/model-{today}/train.csv",
         "validation_uri": f"s3://{bucket}/data/model-{today}/validation.csv",
         "test_uri": f"s3://{bucket}/data/model-{today}/test.csv",
+        "features_uri": f"s3://{bucket}/features/model-{today}/",
         "output_path": f"s3://{bucket}/models/model-{today}/",
         "batch_output_path": f"s3://{bucket}/batch/model-{today}/",
         "instance_type": os.environ['training_instance'],
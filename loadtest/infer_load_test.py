@@ -0,0 +1,292 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('fraud_treshold', '0.6')
+
+import infer
+
+STAGES = [
+    'validation',
+    'package_lookup',
+    'feature_lookup',
+    'transform',
+    'invoke',
+    'response_build'
+]
+
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+transaction_types = ['PAYMENT', 'TRANSFER', 'CASH_OUT', 'DEBIT', 'CASH_IN']
+
+class LocalSageMakerRuntime:
+    # Stand-in for the "sagemaker-runtime" client with injectable latency and errors
+    def __init__(self, latency_ms, jitter_ms, error_rate):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType):
+        time.sleep(max(0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        if random.random() < self.error_rate:
+            raise RuntimeError(f'Injected invoke error on {EndpointName}')
+        rows = len(Body.strip('\n').split('\n'))
+        scores = '\n'.join(str(round(random.random(), 6)) for _ in range(rows))
+        return {'Body': io.BytesIO(scores.encode('utf-8'))}
+
+class LocalSageMaker:
+    # Stand-in for the "sagemaker" client, only what /infer uses
+    def __init__(self, latency_ms, feature_set):
+        self.latency_ms = latency_ms
+        self.feature_set = feature_set
+
+    def describe_model_package(self, ModelPackageName):
+        time.sleep(self.latency_ms / 1000)
+        return {'CustomerMetadataProperties': {'endpoint_name': 'local-endpoint', 'feature_set': self.feature_set}}
+
+class SimulatedFeatureStore:
+    # Wraps the local feature store with injectable latency and errors, as a DynamoDB stand-in
+    def __init__(self, store, latency_ms, error_rate):
+        self.store = store
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+
+    def batch_get(self, account_ids):
+        time.sleep(self.latency_ms / 1000)
+        if random.random() < self.error_rate:
+            raise RuntimeError('Injected feature store error')
+        return self.store.batch_get(account_ids)
+
+# Stage timings of the request running in this worker process
+timings = {}
+
+def timed(stage, function):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] = (time.perf_counter() - start) * 1000
+    return wrapper
+
+def init_worker(config):
+    # Each worker process plays one lambda container, with its own stand-ins and cache
+    sys.stdout = open(os.devnull, 'w')
+    runtime = LocalSageMakerRuntime(config['invoke_latency_ms'], config['invoke_jitter_ms'], config['invoke_error_rate'])
+    client = LocalSageMaker(config['package_latency_ms'], config['feature_set'])
+    infer.sagemaker = runtime
+    infer.sagemaker_client = client
+    infer.check_body = timed('validation', infer.check_body)
+    infer.treat_transaction = timed('transform', infer.treat_transaction)
+    infer.treat_inference = timed('response_build', infer.treat_inference)
+    client.describe_model_package = timed('package_lookup', client.describe_model_package)
+    runtime.invoke_endpoint = timed('invoke', runtime.invoke_endpoint)
+    infer.feature_store.get_account_features = timed('feature_lookup', infer.feature_store.get_account_features)
+    store = infer.feature_store.LocalFeatureStore(config['feature_store_path'])
+    infer.feature_store.store = SimulatedFeatureStore(store, config['store_latency_ms'], config['store_error_rate'])
+
+def send(request, scheduled):
+    timings.clear()
+    try:
+        response = infer.lambda_handler({'body': json.dumps(request)}, None)
+    except Exception as e:
+        response = {'statusCode': 'exception', 'body': repr(e)}
+    # The feature lookup runs inside treat_transaction, keep the stages disjoint
+    if 'transform' in timings and 'feature_lookup' in timings:
+        timings['transform'] -= timings['feature_lookup']
+    return {
+        "status": response['statusCode'],
+        "body": response['body'] if response['statusCode'] != 200 else None,
+        # Measured from the scheduled time, so queueing delay is not hidden.
+        # time.monotonic is system-wide, so it compares across processes.
+        "latency": (time.monotonic() - scheduled) * 1000,
+        "stages": dict(timings)
+    }
+
+def warm_up(request):
+    # Pays imports and first pandas calls before the clock starts
+    send(request, time.monotonic())
+    time.sleep(0.5)
+
+def load_requests(path):
+    # Accepts a single request (api/input_example.json shape), a list of them or JSON lines
+    with open(path) as f:
+        content = f.read()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+def synthetic_requests(count, batch_size, accounts, model_package_arn):
+    requests = []
+    for _ in range(count):
+        transactions = {}
+        for i in range(batch_size):
+            amount = round(random.uniform(1, 500000), 2)
+            balance = round(random.uniform(0, 1000000), 2)
+            transactions[str(i)] = {
+                "step": random.randint(1, 743),
+                "type": random.choice(transaction_types),
+                "amount": amount,
+                "nameOrig": f"C{random.randint(0, accounts)}",
+                "oldbalanceOrg": balance,
+                "newbalanceOrig": max(0, round(balance - amount, 2)),
+                "nameDest": f"C{random.randint(0, accounts)}",
+                "oldbalanceDest": 0,
+                "newbalanceDest": amount,
+                "isFlaggedFraud": 0
+            }
+        requests.append({"model_package_arn": model_package_arn, "transactions": transactions})
+    return requests
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def histogram(values):
+    counts = {}
+    for value in values:
+        bucket = next((b for b in HISTOGRAM_BUCKETS_MS if value <= b), None)
+        label = f'<= {bucket} ms' if bucket else f'> {HISTOGRAM_BUCKETS_MS[-1]} ms'
+        counts[label] = counts.get(label, 0) + 1
+    labels = [f'<= {b} ms' for b in HISTOGRAM_BUCKETS_MS] + [f'> {HISTOGRAM_BUCKETS_MS[-1]} ms']
+    return {label: counts[label] for label in labels if label in counts}
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50": round(percentile(values, 50), 3),
+        "p90": round(percentile(values, 90), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3) if values else 0.0
+    }
+
+def run(requests, qps, concurrency, duration, config):
+    # Closed loop (no target QPS) keeps at most "concurrency" requests in flight
+    in_flight = threading.Semaphore(concurrency)
+    futures = []
+    with ProcessPoolExecutor(max_workers=concurrency, initializer=init_worker, initargs=(config,)) as executor:
+        list(executor.map(warm_up, requests[:1] * concurrency))
+        start = time.monotonic()
+        i = 0
+        while time.monotonic() - start < duration:
+            if qps:
+                scheduled = start + i / qps
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                in_flight.acquire()
+                scheduled = time.monotonic()
+            future = executor.submit(send, requests[i % len(requests)], scheduled)
+            if not qps:
+                future.add_done_callback(lambda f: in_flight.release())
+            futures.append(future)
+            i += 1
+        results = [future.result() for future in futures]
+    return results, time.monotonic() - start
+
+def report(results, elapsed):
+    # Latency and stages only over successful requests, a fast failure is not a fast request
+    succeeded = [result for result in results if result['status'] == 200]
+    latencies = [result['latency'] for result in succeeded]
+    errors = {}
+    for result in results:
+        if result['status'] != 200:
+            key = f"{result['status']}: {result['body']}"
+            errors[key] = errors.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "error_rate": round(1 - len(succeeded) / len(results), 4) if results else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "histogram": histogram(latencies),
+        "stages_ms": {stage: summarize([r['stages'][stage] for r in succeeded if stage in r['stages']]) for stage in STAGES},
+        "errors": errors
+    }
+
+def print_report(summary):
+    print(f"Requests: {summary['requests']} in {summary['elapsed_s']}s ({summary['throughput_qps']} req/s)")
+    print(f"Error rate: {round(summary['error_rate'] * 100, 2)}% ({summary['requests'] - summary['succeeded']} failed)")
+    latency = summary['latency_ms']
+    print(f"Latency ms (successful only): p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']} mean={latency['mean']}")
+    print("Histogram:")
+    for label, count in summary['histogram'].items():
+        print(f"  {label:>12} {count:>8} {'#' * int(50 * count / summary['succeeded'])}")
+    print("Stages ms:")
+    for stage, stats in summary['stages_ms'].items():
+        print(f"  {stage:<15} n={stats['count']:<7} p50={stats['p50']:<9} p99={stats['p99']:<9} mean={stats['mean']}")
+    print("Errors:" if summary['errors'] else "Errors: none")
+    for error, count in summary['errors'].items():
+        print(f"  {count:>8} {error}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replays transaction batches against infer.lambda_handler and reports latency.')
+    parser.add_argument('--input', help='Recorded requests (api/input_example.json shape, list or JSON lines). Synthetic if omitted.')
+    parser.add_argument('--synthetic-requests', type=int, default=100, help='Distinct synthetic requests to generate')
+    parser.add_argument('--batch-size', type=int, default=10, help='Transactions per synthetic request')
+    parser.add_argument('--accounts', type=int, default=10000, help='Synthetic account pool size')
+    parser.add_argument('--qps', type=float, default=0, help='Target requests per second, 0 to run as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=4, help='Worker processes, each one plays a lambda container')
+    parser.add_argument('--duration', type=float, default=10, help='Test duration in seconds')
+    parser.add_argument('--invoke-latency-ms', type=float, default=20, help='Mean latency injected in invoke_endpoint')
+    parser.add_argument('--invoke-jitter-ms', type=float, default=5, help='Standard deviation of the injected latency')
+    parser.add_argument('--invoke-error-rate', type=float, default=0, help='Fraction of invoke_endpoint calls that fail')
+    parser.add_argument('--package-latency-ms', type=float, default=10, help='Latency injected in describe_model_package')
+    parser.add_argument('--feature-store-path', help='Local account feature store (JSON). Empty store if omitted.')
+    parser.add_argument('--store-latency-ms', type=float, default=5, help='Latency injected in each feature store batch lookup')
+    parser.add_argument('--store-error-rate', type=float, default=0, help='Fraction of feature store lookups that fail')
+    parser.add_argument('--feature-set', default='account', help='"feature_set" of the simulated model package (base or account)')
+    parser.add_argument('--output', help='Writes the summary as JSON to this path')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Exits with an error above this fraction of failed requests')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.concurrency > (os.cpu_count() or 1):
+        print(f"WARNING: {args.concurrency} workers on {os.cpu_count()} CPUs, CPU-bound stages will be inflated")
+    if args.input:
+        requests = load_requests(args.input)
+    else:
+        requests = synthetic_requests(args.synthetic_requests, args.batch_size, args.accounts, 'local-model-package')
+
+    config = {
+        "invoke_latency_ms": args.invoke_latency_ms,
+        "invoke_jitter_ms": args.invoke_jitter_ms,
+        "invoke_error_rate": args.invoke_error_rate,
+        "package_latency_ms": args.package_latency_ms,
+        "feature_store_path": args.feature_store_path,
+        "store_latency_ms": args.store_latency_ms,
+        "store_error_rate": args.store_error_rate,
+        "feature_set": args.feature_set
+    }
+
+    results, elapsed = run(requests, args.qps, args.concurrency, args.duration, config)
+    summary = report(results, elapsed)
+    print_report(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=4)
+    if summary['requests'] == 0:
+        print("FAILED: no request completed, increase --duration")
+        sys.exit(1)
+    if summary['error_rate'] > args.max_error_rate:
+        print(f"FAILED: error rate above {args.max_error_rate}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()